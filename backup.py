@@ -0,0 +1,59 @@
+"""
+Online backups of the SQLite database.
+
+Uses SQLite's backup API to copy the live database a few pages at a time,
+sleeping between steps so log_submission writers are never blocked for long.
+If a write lands mid-copy, SQLite restarts the copy, so a finished backup is
+always a consistent snapshot. Backups are written to a temp file, renamed into
+place, and rotated so only the newest BACKUP_KEEP are kept.
+"""
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+import database
+
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "24"))
+BACKUP_INTERVAL_MINUTES = int(os.getenv("BACKUP_INTERVAL_MINUTES", "60"))
+# Pages copied per step, and the pause between steps (seconds)
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.01"))
+
+def create_backup():
+    """Takes an online backup. Returns (path, size_bytes, seconds)."""
+    os.makedirs(database.BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    name = f"monitoring-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    path = os.path.join(database.BACKUP_DIR, name)
+    tmp_path = path + ".tmp"
+
+    src = database.get_connection()
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+    except Exception:
+        dst.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        src.close()
+    dst.close()
+    os.replace(tmp_path, path)
+
+    rotate()
+    seconds = time.perf_counter() - started
+    size = os.path.getsize(path)
+    logging.info(f"Backup written to {path} ({size / 1024:.0f} KB) in {seconds:.2f}s")
+    return path, size, seconds
+
+def rotate(keep=None):
+    """Deletes all but the newest `keep` backups."""
+    if keep is None:
+        keep = BACKUP_KEEP
+    backups = database.list_snapshots()
+    for path in backups[:max(0, len(backups) - keep)]:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.error(f"Failed to remove old backup {path}: {e}")
@@ -0,0 +1,143 @@
+"""
+Benchmarks for the heavier data paths.
+
+Usage:
+    python benchmarks.py streaks [rows]
+    python benchmarks.py reports [users]
+
+Each benchmark builds a throwaway SQLite database with synthetic history,
+so it never touches the real monitoring.db.
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import database
+
+def _build_history(rows, groups=20, users_per_group=500, days=365, seed=42):
+    """Fills a fresh temp database with roughly `rows` submissions."""
+    rng = random.Random(seed)
+    today = date.today()
+    per_user = max(1, rows // (groups * users_per_group))
+    user_rows = []
+    sub_rows = []
+    for g in range(1, groups + 1):
+        group_id = -1000 - g
+        for u in range(1, users_per_group + 1):
+            user_rows.append((u, group_id, f"User {u}"))
+            # Pick distinct days, biased towards recent ones
+            offsets = rng.sample(range(days), min(per_user, days))
+            for off in offsets:
+                ts = datetime.combine(today - timedelta(days=off), datetime.min.time()) + timedelta(hours=9)
+                sub_rows.append((u, group_id, ts.isoformat()))
+
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.executemany("INSERT INTO users (user_id, group_id, full_name, streak, total_submissions) VALUES (?, ?, ?, 0, 0)", user_rows)
+    c.executemany("INSERT INTO submissions (user_id, group_id, timestamp) VALUES (?, ?, ?)", sub_rows)
+    conn.commit()
+    conn.close()
+    return len(sub_rows)
+
+def _temp_database():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    database.DB_NAME = path
+    database.init_db()
+    return path
+
+def bench_streaks(rows=2_000_000):
+    import streaks
+
+    path = _temp_database()
+    try:
+        t0 = time.perf_counter()
+        n = _build_history(rows)
+        print(f"Built {n} submissions in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        day_rows = database.get_submission_days()
+        t_load = time.perf_counter() - t0
+
+        g, u, d = zip(*day_rows)
+        t0 = time.perf_counter()
+        streaks.compute_streaks(g, u, d)
+        t_compute = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        updated = streaks.recompute_streaks()
+        t_total = time.perf_counter() - t0
+
+        print(f"load: {t_load:.2f}s  compute: {t_compute:.3f}s  end-to-end: {t_total:.2f}s  ({updated} users updated)")
+    finally:
+        os.remove(path)
+
+def _measure(func, *args):
+    """
+    Returns (seconds, peak traced memory in MB).
+    Runs func twice: once for timing, once under tracemalloc (which slows it down).
+    """
+    t0 = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 1024 / 1024
+
+def bench_reports(users=10_000):
+    import directory
+    import reports
+
+    path = _temp_database()
+    cwd = os.getcwd()
+    out_dir = tempfile.mkdtemp()
+    try:
+        _build_history(users * 20, groups=1, users_per_group=users, days=30)
+        group_id = -1001
+        os.chdir(out_dir)
+
+        def load_columns():
+            directory.rebuild()
+            return directory.columns(group_id)
+
+        print(f"{users} users, time and peak allocated memory per call")
+        cases = [
+            ('users as list of dicts (get_all_users)', database.get_all_users, (group_id,)),
+            ('users as columns, cold (load + copy)', load_columns, ()),
+            ('users as columns, warm (copy)', directory.columns, (group_id,)),
+        ]
+
+        today = date.today()
+        cases += [
+            ('generate_missing_workers_excel', reports.generate_missing_workers_excel, (group_id,)),
+            ('get_past_week_stats', reports.get_past_week_stats, (group_id,)),
+            ('generate_weekly_report', reports.generate_weekly_report, (group_id,)),
+            ('generate_low_attendance_excel', reports.generate_low_attendance_excel, (group_id,)),
+            ('generate_attendance_register (30d)', reports.generate_attendance_register,
+             (group_id, today - timedelta(days=29), today)),
+        ]
+        for name, func, args in cases:
+            seconds, peak = _measure(func, *args)
+            print(f"{name:<40} {seconds:7.3f}s {peak:8.1f} MB")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.remove(path)
+
+BENCHMARKS = {
+    'streaks': bench_streaks,
+    'reports': bench_reports,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmarks.py [{'|'.join(BENCHMARKS)}] [rows]")
+        sys.exit(1)
+    args = [int(a) for a in sys.argv[2:]]
+    BENCHMARKS[sys.argv[1]](*args)
@@ -1,6 +1,8 @@
 import sqlite3
 from datetime import datetime, date, timedelta
 import os
+import pytz
+from profiling import traced
 
 # Use Railway Volume if it exists, otherwise use local file
 if os.path.exists('/app/data'):
@@ -10,9 +12,52 @@ if os.path.exists('/app/data'):
 else:
     DB_NAME = "monitoring.db"
 
+# Online backups (see backup.py) live next to the database
+BACKUP_DIR = os.path.join(os.path.dirname(DB_NAME), "backups")
+# Snapshots older than this are not used for reads; the live database is used instead
+SNAPSHOT_MAX_AGE_MINUTES = int(os.getenv("SNAPSHOT_MAX_AGE_MINUTES", "120"))
+
 def get_connection():
     return sqlite3.connect(DB_NAME)
 
+def _open_snapshot(path):
+    """Opens a backup read-only."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+def _snapshot_taken_at(path):
+    """When a backup was started (aware), from its name (monitoring-YYYYmmdd-HHMMSS.db, server local time)."""
+    stamp = os.path.basename(path)[len("monitoring-"):-len(".db")]
+    return datetime.strptime(stamp, '%Y%m%d-%H%M%S').astimezone()
+
+def list_snapshots():
+    """Backup paths, oldest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    # Backup names sort chronologically (monitoring-YYYYmmdd-HHMMSS.db)
+    names = sorted(n for n in os.listdir(BACKUP_DIR) if n.startswith("monitoring-") and n.endswith(".db"))
+    return [os.path.join(BACKUP_DIR, n) for n in names]
+
+def get_latest_snapshot(max_age_minutes=None):
+    """Returns the path of the newest backup younger than max_age_minutes, or None."""
+    if max_age_minutes is None:
+        max_age_minutes = SNAPSHOT_MAX_AGE_MINUTES
+    snapshots = list_snapshots()
+    if not snapshots:
+        return None
+    path = snapshots[-1]
+    age = datetime.now().timestamp() - os.path.getmtime(path)
+    if age > max_age_minutes * 60:
+        return None
+    return path
+
+# Per-group settings stored on the groups table, with their defaults
+GROUP_SETTINGS = {
+    'timezone': 'Asia/Kolkata',
+    'reminder_time': '08:00',
+    'status_time': '14:00',
+    'report_time': '18:00',
+}
+
 def init_db():
     conn = get_connection()
     c = conn.cursor()
@@ -22,6 +67,12 @@ def init_db():
                     group_id INTEGER PRIMARY KEY,
                     title TEXT
                 )''')
+
+    # Per-group schedule settings (added later, so migrate existing databases)
+    existing = {r[1] for r in c.execute("PRAGMA table_info(groups)").fetchall()}
+    for column, default in GROUP_SETTINGS.items():
+        if column not in existing:
+            c.execute(f"ALTER TABLE groups ADD COLUMN {column} TEXT DEFAULT '{default}'")
     
     # Users table - keyed by (user_id, group_id) to allow independent stats per group
     # Note: SQLite doesn't strictly enforce composite PKs easily in migration without drop, 
@@ -45,6 +96,16 @@ def init_db():
                     FOREIGN KEY(user_id, group_id) REFERENCES users(user_id, group_id)
                 )''')
 
+    # Scheduled job shard runs (see scheduler.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS job_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT,
+                    planned_at TEXT,
+                    started_at TEXT,
+                    duration REAL,
+                    group_count INTEGER
+                )''')
+
     conn.commit()
     conn.close()
 
@@ -52,7 +113,9 @@ def register_group(group_id, title):
     """Registers or updates a group's title."""
     conn = get_connection()
     c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO groups (group_id, title) VALUES (?, ?)", (group_id, title))
+    # Upsert so per-group settings survive title updates
+    c.execute("INSERT INTO groups (group_id, title) VALUES (?, ?) ON CONFLICT(group_id) DO UPDATE SET title = excluded.title",
+              (group_id, title))
     conn.commit()
     conn.close()
 
@@ -65,6 +128,86 @@ def get_all_active_groups():
     conn.close()
     return results
 
+def get_group_settings(group_id=None):
+    """Returns {group_id: {'title': ..., 'timezone': ..., 'reminder_time': ..., ...}}."""
+    conn = get_connection()
+    c = conn.cursor()
+    columns = list(GROUP_SETTINGS)
+    query = f"SELECT group_id, title, {', '.join(columns)} FROM groups"
+    if group_id is None:
+        c.execute(query)
+    else:
+        c.execute(query + " WHERE group_id = ?", (group_id,))
+    results = {}
+    for r in c.fetchall():
+        settings = {'title': r[1]}
+        for column, value in zip(columns, r[2:]):
+            settings[column] = value or GROUP_SETTINGS[column]
+        results[r[0]] = settings
+    conn.close()
+    return results
+
+def _timezone(timezone_name):
+    try:
+        return pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(GROUP_SETTINGS['timezone'])
+
+def local_now(timezone_name):
+    """Current naive local time in a timezone (the default timezone if the name is unknown)."""
+    return datetime.now(_timezone(timezone_name)).replace(tzinfo=None)
+
+def get_group_now(group_id):
+    """
+    Current local time in the group's timezone. Submissions are timestamped in it,
+    so dates in reports and streaks are the group's own dates (see set_group_timezone).
+    """
+    settings = get_group_settings(group_id).get(group_id, GROUP_SETTINGS)
+    return local_now(settings['timezone'])
+
+def set_group_timezone(group_id, timezone_name):
+    """
+    Changes a group's timezone. Its submission timestamps are stored in local time,
+    so they are converted from the old timezone to the new one (and each member's
+    last_submission_date with them) in the same transaction; history keeps meaning
+    the same instants. Recompute the group's streaks afterwards.
+    """
+    new_tz = pytz.timezone(timezone_name)
+    conn = get_connection()
+    c = conn.cursor()
+    # Also blocks log_submission, which reads the timezone inside its own write transaction
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("SELECT timezone FROM groups WHERE group_id = ?", (group_id,))
+    row = c.fetchone()
+    old_tz = _timezone(row[0] if row and row[0] else GROUP_SETTINGS['timezone'])
+    if old_tz.zone != new_tz.zone:
+        c.execute("SELECT id, timestamp FROM submissions WHERE group_id = ?", (group_id,))
+        converted = [
+            (old_tz.localize(datetime.fromisoformat(ts)).astimezone(new_tz).replace(tzinfo=None).isoformat(), sub_id)
+            for sub_id, ts in c.fetchall()
+        ]
+        c.executemany("UPDATE submissions SET timestamp = ? WHERE id = ?", converted)
+        c.execute("""
+            UPDATE users SET last_submission_date = (
+                SELECT MAX(date(s.timestamp)) FROM submissions s
+                WHERE s.user_id = users.user_id AND s.group_id = users.group_id
+            ) WHERE group_id = ?
+        """, (group_id,))
+    c.execute("UPDATE groups SET timezone = ? WHERE group_id = ?", (new_tz.zone, group_id))
+    conn.commit()
+    conn.close()
+
+def set_group_setting(group_id, column, value):
+    if column not in GROUP_SETTINGS:
+        raise ValueError(f"Unknown group setting: {column}")
+    if column == 'timezone':
+        return set_group_timezone(group_id, value)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"UPDATE groups SET {column} = ? WHERE group_id = ?", (value, group_id))
+    conn.commit()
+    conn.close()
+
 def add_user_if_not_exists(user_id, group_id, full_name):
     conn = get_connection()
     c = conn.cursor()
@@ -79,15 +222,23 @@ def add_user_if_not_exists(user_id, group_id, full_name):
         conn.commit()
     conn.close()
 
+@traced('database.log_submission')
 def log_submission(user_id, group_id):
     """
     Logs a submission and updates streaks for a specific group.
     """
     conn = get_connection()
     c = conn.cursor()
+    # Read the timezone inside the write transaction so a concurrent set_group_timezone
+    # can't convert history between us reading it and inserting in the old timezone
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("SELECT timezone FROM groups WHERE group_id = ?", (group_id,))
+    row = c.fetchone()
+    now = local_now(row[0] if row and row[0] else GROUP_SETTINGS['timezone'])
+    today_date = now.date()
     
-    today_str = date.today().isoformat()
-    yesterday_str = (date.today() - timedelta(days=1)).isoformat()
+    today_str = today_date.isoformat()
+    yesterday_str = (today_date - timedelta(days=1)).isoformat()
     
     # Check if already submitted today in THIS group
     c.execute("SELECT id FROM submissions WHERE user_id = ? AND group_id = ? AND date(timestamp) = ?", 
@@ -100,7 +251,7 @@ def log_submission(user_id, group_id):
         return 'already_submitted', streak
 
     # Record submission
-    now_str = datetime.now().isoformat()
+    now_str = now.isoformat()
     c.execute("INSERT INTO submissions (user_id, group_id, timestamp) VALUES (?, ?, ?)", (user_id, group_id, now_str))
     
     # Update user stats
@@ -117,7 +268,6 @@ def log_submission(user_id, group_id):
     last_date = row[1]
     total_submissions = row[2] + 1
     
-    today_date = date.today()
     # Check for Monday -> Saturday skip (Sunday optional)
     is_monday = (today_date.weekday() == 0) # 0 is Monday
     saturday_str = (today_date - timedelta(days=2)).isoformat() if is_monday else None
@@ -141,10 +291,12 @@ def log_submission(user_id, group_id):
     return 'new_submission', new_streak
 
 def get_submitted_today_count(group_id):
+    return get_submitted_count_by_date(group_id, date.today().isoformat())
+
+def get_submitted_count_by_date(group_id, date_str):
     conn = get_connection()
     c = conn.cursor()
-    today_str = date.today().isoformat()
-    c.execute("SELECT COUNT(DISTINCT user_id) FROM submissions WHERE group_id = ? AND date(timestamp) = ?", (group_id, today_str))
+    c.execute("SELECT COUNT(DISTINCT user_id) FROM submissions WHERE group_id = ? AND date(timestamp) = ?", (group_id, date_str))
     count = c.fetchone()[0]
     conn.close()
     return count
@@ -157,6 +309,18 @@ def get_all_users(group_id):
     conn.close()
     return users
 
+def get_user_columns(group_id):
+    """Returns (user_ids, full_names, streaks) as parallel lists, for directory.py."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT user_id, full_name, COALESCE(streak, 0) FROM users WHERE group_id = ?", (group_id,))
+    rows = c.fetchall()
+    conn.close()
+    if not rows:
+        return [], [], []
+    user_ids, names, streaks = zip(*rows)
+    return list(user_ids), list(names), list(streaks)
+
 def get_submitted_users_today(group_id):
     # Wrapper for backward compatibility or simple usage
     return get_submitted_users_by_date(group_id, date.today().isoformat())
@@ -172,19 +336,150 @@ def get_submitted_users_by_date(group_id, date_str):
 def get_top_performing_users(group_id, limit=5):
     conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT full_name, streak FROM users WHERE group_id = ? AND streak > 0 ORDER BY streak DESC LIMIT ?", (group_id, limit))
+    c.execute("SELECT full_name, streak FROM users WHERE group_id = ? AND streak > 0 ORDER BY streak DESC, user_id LIMIT ?", (group_id, limit))
     results = c.fetchall()
     conn.close()
     return results
 
-def get_submissions_between_dates(group_id, start_date_str, end_date_str):
-    conn = get_connection()
+def _submissions_between(conn, group_id, start_date_str, end_date_str, before_date_str=None):
     c = conn.cursor()
-    c.execute("""
+    query = """
         SELECT user_id, date(timestamp) 
         FROM submissions 
         WHERE group_id = ? AND date(timestamp) >= ? AND date(timestamp) <= ?
-    """, (group_id, start_date_str, end_date_str))
+    """
+    params = (group_id, start_date_str, end_date_str)
+    if before_date_str is not None:
+        query += " AND date(timestamp) < ?"
+        params += (before_date_str,)
+    c.execute(query, params)
+    results = c.fetchall()
+    conn.close()
+    return results
+
+def get_submissions_between_dates(group_id, start_date_str, end_date_str, snapshot=False):
+    """
+    Returns (user_id, date_str) rows for submissions between two dates (inclusive).
+    With snapshot=True, the days the latest recent backup fully covers are read from it,
+    and later days from the live database, so recent submissions are never missed.
+    """
+    path = get_latest_snapshot() if snapshot else None
+    if path is None:
+        return _submissions_between(get_connection(), group_id, start_date_str, end_date_str)
+
+    # Days before the group's local date at the time of the backup are complete in it
+    tz = _timezone(get_group_settings(group_id).get(group_id, GROUP_SETTINGS)['timezone'])
+    cutoff_str = _snapshot_taken_at(path).astimezone(tz).date().isoformat()
+    results = []
+    if start_date_str < cutoff_str:
+        results += _submissions_between(_open_snapshot(path), group_id, start_date_str, end_date_str, cutoff_str)
+    results += _submissions_between(get_connection(), group_id, max(start_date_str, cutoff_str), end_date_str)
+    return results
+
+def _in_groups(group_ids):
+    """SQL filter (and its parameters) for a list of group ids."""
+    return f" WHERE group_id IN ({', '.join('?' * len(group_ids))})", tuple(group_ids)
+
+def get_submission_days(group_ids=None):
+    """
+    Returns distinct (group_id, user_id, day_ordinal) rows for the streak engine.
+    day_ordinal matches date.toordinal() so it can be used directly as an integer day.
+    If group_ids is None, rows for all groups are returned.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    query = """
+        SELECT DISTINCT group_id, user_id,
+               CAST(julianday(date(timestamp)) - 1721424.5 AS INTEGER)
+        FROM submissions
+    """
+    if group_ids is None:
+        c.execute(query)
+    else:
+        where, params = _in_groups(group_ids)
+        c.execute(query + where, params)
+    results = c.fetchall()
+    conn.close()
+    return results
+
+def get_streaks(group_ids=None):
+    """Returns {(group_id, user_id): streak} for the given groups, or all groups if None."""
+    conn = get_connection()
+    c = conn.cursor()
+    if group_ids is None:
+        c.execute("SELECT group_id, user_id, streak FROM users")
+    else:
+        where, params = _in_groups(group_ids)
+        c.execute("SELECT group_id, user_id, streak FROM users" + where, params)
+    results = {(r[0], r[1]): r[2] for r in c.fetchall()}
+    conn.close()
+    return results
+
+def set_streaks(rows, watermark):
+    """
+    Bulk-updates streaks. rows is an iterable of (streak, user_id, group_id).
+    A row is skipped if the user submitted after `watermark` (a submission id),
+    since log_submission has already updated their streak from newer history.
+    Returns the rows that were written.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    written = []
+    for streak, user_id, group_id in rows:
+        c.execute("""
+            UPDATE users SET streak = ? WHERE user_id = ? AND group_id = ?
+            AND NOT EXISTS (SELECT 1 FROM submissions WHERE id > ? AND user_id = ? AND group_id = ?)
+        """, (streak, user_id, group_id, watermark, user_id, group_id))
+        if c.rowcount:
+            written.append((streak, user_id, group_id))
+    conn.commit()
+    conn.close()
+    return written
+
+def get_max_submission_id():
+    """Highest submission id so far; used as a watermark for incremental refreshes."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM submissions")
+    result = c.fetchone()[0]
+    conn.close()
+    return result
+
+def get_all_submitters_since(since_id):
+    """Returns {(group_id, user_id)} with any submission recorded after submission id `since_id`."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT group_id, user_id FROM submissions WHERE id > ?", (since_id,))
+    results = set(c.fetchall())
+    conn.close()
+    return results
+
+def get_submitters_since(group_id, since_id, date_str):
+    """Returns user_ids with a submission on date_str recorded after submission id `since_id`."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT user_id FROM submissions WHERE id > ? AND group_id = ? AND date(timestamp) = ?",
+              (since_id, group_id, date_str))
+    ids = [r[0] for r in c.fetchall()]
+    conn.close()
+    return set(ids)
+
+def log_job_run(job, planned_at, started_at, duration, group_count, keep_days=7):
+    """Records how long a scheduled shard ran, pruning entries older than keep_days."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO job_runs (job, planned_at, started_at, duration, group_count) VALUES (?, ?, ?, ?, ?)",
+              (job, planned_at, started_at, duration, group_count))
+    cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+    c.execute("DELETE FROM job_runs WHERE started_at < ?", (cutoff,))
+    conn.commit()
+    conn.close()
+
+def get_recent_job_runs(limit=10):
+    """Returns the latest (job, planned_at, started_at, duration, group_count) rows, newest first."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT job, planned_at, started_at, duration, group_count FROM job_runs ORDER BY id DESC LIMIT ?", (limit,))
     results = c.fetchall()
     conn.close()
     return results
@@ -0,0 +1,204 @@
+"""
+Compact, columnar in-memory user directory per group: the bot's single cache of
+group members, used by the reports and the streak leaderboard.
+
+Each group's users live in parallel arrays (user_ids, streaks as numpy arrays,
+names as a list) addressed by a dense index, instead of a list of dicts
+rebuilt on every report, together with the group's streak ranking
+(leaderboard.GroupLeaderboard). The directory is loaded lazily per group and
+updated incrementally when a user is added, renamed or their streak changes.
+
+Reports call columns(group_id), which returns a consistent copy of the arrays
+(UserColumns) that is safe to use from report threads while the bot keeps
+updating the directory. /top, /rank and the daily summary use top() and rank().
+
+In sharded webhook mode each worker only caches the groups routed to it
+(set_owner). Other groups are read fresh from the database (used by the leader's jobs).
+"""
+import threading
+import numpy as np
+import database
+from leaderboard import GroupLeaderboard
+
+_INITIAL_CAPACITY = 16
+
+class UserColumns:
+    """Read-only column view of a group's users at one point in time."""
+
+    def __init__(self, user_ids, names, streaks):
+        self.user_ids = user_ids  # np.int64 array
+        self.names = names        # np object array
+        self.streaks = streaks    # np.int32 array
+        self._order = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def index_of(self, user_ids):
+        """
+        Maps an array of user ids to dense indexes into these columns.
+        Unknown ids map to -1.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.user_ids) == 0 or len(user_ids) == 0:
+            return np.full(len(user_ids), -1, dtype=np.int64)
+        if self._order is None:
+            self._order = np.argsort(self.user_ids, kind='stable')
+        sorted_ids = self.user_ids[self._order]
+        pos = np.searchsorted(sorted_ids, user_ids)
+        pos = np.minimum(pos, len(sorted_ids) - 1)
+        found = sorted_ids[pos] == user_ids
+        return np.where(found, self._order[pos], -1)
+
+class GroupDirectory:
+    """Growable columnar storage for one group's users."""
+
+    def __init__(self):
+        self._ids = np.empty(_INITIAL_CAPACITY, dtype=np.int64)
+        self._streaks = np.empty(_INITIAL_CAPACITY, dtype=np.int32)
+        self._names = []
+        self._index = {}  # {user_id: dense index}
+        self._size = 0
+        self._ranking = GroupLeaderboard()
+
+    @classmethod
+    def from_columns(cls, user_ids, names, streaks):
+        directory = cls()
+        n = len(user_ids)
+        capacity = max(_INITIAL_CAPACITY, n)
+        directory._ids = np.resize(np.asarray(user_ids, dtype=np.int64), capacity)
+        directory._streaks = np.resize(np.asarray(streaks, dtype=np.int32), capacity)
+        directory._names = list(names)
+        directory._index = {user_id: i for i, user_id in enumerate(user_ids)}
+        directory._size = n
+        directory._ranking = GroupLeaderboard.from_streaks(user_ids, streaks)
+        return directory
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        self._ids = np.resize(self._ids, capacity)
+        self._streaks = np.resize(self._streaks, capacity)
+
+    def update(self, user_id, full_name=None, streak=None):
+        """Adds a user or updates their name/streak in place."""
+        i = self._index.get(user_id)
+        if i is None:
+            if self._size == len(self._ids):
+                self._grow()
+            i = self._size
+            self._size += 1
+            self._index[user_id] = i
+            self._ids[i] = user_id
+            self._streaks[i] = 0
+            self._names.append(str(user_id))
+            self._ranking.update(user_id, 0)
+        if full_name is not None:
+            self._names[i] = full_name
+        if streak is not None:
+            self._streaks[i] = streak
+            self._ranking.update(user_id, streak)
+
+    def columns(self):
+        n = self._size
+        names = np.empty(n, dtype=object)
+        names[:] = self._names
+        return UserColumns(self._ids[:n].copy(), names, self._streaks[:n].copy())
+
+    def _named(self, ranked):
+        return [(self._names[self._index[uid]], streak) for uid, streak in ranked]
+
+    def top(self, n):
+        """Highest streaks first, skipping users with no streak. Returns [(name, streak)]."""
+        return self._named(self._ranking.top(n))
+
+    def bottom(self, n):
+        """Lowest streaks first. Returns [(name, streak)]."""
+        return self._named(self._ranking.bottom(n))
+
+    def rank(self, user_id):
+        """Returns (rank, total, streak) for a user, or None if unknown."""
+        return self._ranking.rank(user_id)
+
+_directories = {}  # {group_id: GroupDirectory}
+_lock = threading.Lock()
+
+def _owns_all(group_id):
+    return True
+
+_owns = _owns_all
+
+def set_owner(predicate):
+    """Restricts caching to groups for which predicate(group_id) is True."""
+    global _owns
+    with _lock:
+        _owns = predicate
+        for gid in [gid for gid in _directories if not predicate(gid)]:
+            del _directories[gid]
+
+def _load_group(group_id):
+    return GroupDirectory.from_columns(*database.get_user_columns(group_id))
+
+def _get_directory(group_id):
+    # Caller must hold _lock
+    directory = _directories.get(group_id)
+    if directory is None:
+        directory = _load_group(group_id)
+        if _owns(group_id):
+            _directories[group_id] = directory
+    return directory
+
+def columns(group_id):
+    """Returns a UserColumns copy of the group's users."""
+    with _lock:
+        return _get_directory(group_id).columns()
+
+def update(group_id, user_id, full_name=None, streak=None):
+    """Records a new user, or a changed name/streak. Call after the database write."""
+    with _lock:
+        if _owns(group_id):
+            _get_directory(group_id).update(user_id, full_name, streak)
+
+def update_streaks(rows, watermark):
+    """
+    Applies recomputed streaks, rows of (streak, user_id, group_id) computed from history
+    up to submission id `watermark`. Users who submitted since are skipped: photo_handler
+    has cached (or is about to cache) their newer streak. Checked under the lock, which
+    photo_handler's update also takes, so a stale value can't overwrite a fresh one.
+    """
+    with _lock:
+        recent = database.get_all_submitters_since(watermark)
+        for streak, user_id, group_id in rows:
+            if (group_id, user_id) not in recent and _owns(group_id):
+                _get_directory(group_id).update(user_id, streak=streak)
+
+def top(group_id, n=5):
+    with _lock:
+        if not _owns(group_id):
+            # Not cached here; a LIMIT query is cheaper than loading the whole group
+            return database.get_top_performing_users(group_id, n)
+        return _get_directory(group_id).top(n)
+
+def bottom(group_id, n=5):
+    with _lock:
+        return _get_directory(group_id).bottom(n)
+
+def rank(group_id, user_id):
+    with _lock:
+        return _get_directory(group_id).rank(user_id)
+
+def rebuild(group_id=None):
+    """Reloads one group, or every active group this process caches if None."""
+    if group_id is None:
+        group_ids = [gid for gid, _ in database.get_all_active_groups()]
+    else:
+        group_ids = [group_id]
+
+    with _lock:
+        if group_id is None:
+            _directories.clear()
+        for gid in group_ids:
+            if _owns(gid):
+                _directories[gid] = _load_group(gid)
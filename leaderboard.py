@@ -0,0 +1,59 @@
+from bisect import bisect_left, insort
+
+class GroupLeaderboard:
+    """
+    Streak ranking for one group, kept by directory.GroupDirectory alongside
+    the group's user columns (which hold the names).
+    Keeps a sorted list of (-streak, user_id) keys so lookups are binary searches
+    and top/bottom queries are slices.
+    """
+
+    def __init__(self):
+        self._keys = []     # sorted [(-streak, user_id)]
+        self._streaks = {}  # {user_id: streak}
+
+    @classmethod
+    def from_streaks(cls, user_ids, streaks):
+        board = cls()
+        board._streaks = dict(zip(user_ids, streaks))
+        board._keys = sorted((-streak, user_id) for user_id, streak in board._streaks.items())
+        return board
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, user_id, streak):
+        old = self._streaks.get(user_id)
+        if old == streak:
+            return
+        if old is not None:
+            i = bisect_left(self._keys, (-old, user_id))
+            del self._keys[i]
+        insort(self._keys, (-streak, user_id))
+        self._streaks[user_id] = streak
+
+    def top(self, n):
+        """Highest streaks first, skipping users with no streak. Returns [(user_id, streak)]."""
+        results = []
+        for neg_streak, uid in self._keys[:n]:
+            if neg_streak == 0:
+                break
+            results.append((uid, -neg_streak))
+        return results
+
+    def bottom(self, n):
+        """Lowest streaks first. Returns [(user_id, streak)]."""
+        if n <= 0:
+            return []
+        return [(uid, -neg_streak) for neg_streak, uid in reversed(self._keys[-n:])]
+
+    def rank(self, user_id):
+        """
+        Returns (rank, total, streak) for a user, or None if unknown.
+        Tied streaks share a rank (1, 2, 2, 4, ...).
+        """
+        streak = self._streaks.get(user_id)
+        if streak is None:
+            return None
+        rank = bisect_left(self._keys, (-streak, float('-inf'))) + 1
+        return rank, len(self._keys), streak
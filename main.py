@@ -2,7 +2,8 @@ import logging
 import pytz
 import os
 import asyncio
-from datetime import time, datetime, timedelta
+import time as pytime
+from datetime import datetime, timedelta, date
 import database
 import reports
 from telegram import Update
@@ -11,11 +12,26 @@ from dotenv import load_dotenv
 from ultralytics import YOLO
 import random
 import messages
+import streaks
+import directory
+import sharding
+import prerender
+import backup
+import scheduler
+import profiling
+import signal
+import threading
 
 # Load environment variables
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# "polling" (default) or "webhook" (sharded workers, see sharding.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Comma-separated Telegram user IDs allowed to run bot-wide admin commands
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+# Build attendance registers from the latest backup snapshot for the days it fully covers (recent days still come from the live database)
+REPORTS_FROM_SNAPSHOT = os.getenv("REPORTS_FROM_SNAPSHOT", "0") == "1"
 
 # Setup logging
 logging.basicConfig(
@@ -27,6 +43,10 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Removed GLOBAL GROUP_CHAT_ID as we now support multiple groups
 
+# Profiles are written to the data volume next to the database
+PROFILE_DIR = os.path.join(os.path.dirname(database.DB_NAME), "profiles")
+PROFILE_MAX_SECONDS = 300
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = (
         "Hello! 🤖 *Monitoring Bot* is active.\n"
@@ -36,7 +56,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• `/missing` - List of people who missed today\n"
         "• `/weekly` - Past 7 Days Stats\n"
         "• `/fortnightly` - 15 Days Attendance Tracker\n"
-        "• `/monthly` - 30 Days Attendance Tracker"
+        "• `/monthly` - 30 Days Attendance Tracker\n"
+        "• `/top [n]` - Highest Streaks\n"
+        "• `/rank` - Your Streak Rank (reply to a message to see theirs)\n"
+        "• `/settings` - Group Timezone & Report Times"
     )
     await update.message.reply_text(msg, parse_mode='Markdown')
 
@@ -52,6 +75,24 @@ async def register_group_middleware(update: Update, context: ContextTypes.DEFAUL
         title = update.effective_chat.title
         database.register_group(chat_id, title)
 
+async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, bot_wide=False):
+    """
+    Bot admins (ADMIN_IDS) may run any admin command.
+    Group admins may run group-scoped admin commands in their own group.
+    """
+    user_id = update.effective_user.id
+    if user_id in ADMIN_IDS:
+        return True
+    if bot_wide or update.effective_chat.type not in ['group', 'supergroup']:
+        return False
+    try:
+        member = await context.bot.get_chat_member(update.effective_chat.id, user_id)
+        return member.status in ['administrator', 'creator']
+    except Exception as e:
+        logging.error(f"Failed to check admin status for {user_id}: {e}")
+        return False
+
+@profiling.traced('main.photo_handler')
 async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Register/Update group
     await register_group_middleware(update, context)
@@ -93,6 +134,8 @@ async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Log submission
     status, streak = database.log_submission(user.id, group_id)
+    if status != 'error':
+        directory.update(group_id, user.id, full_name, streak)
     
     # Reply logic
     if status == 'new_submission':
@@ -105,8 +148,24 @@ async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass
 
 # Scheduled Jobs
-async def send_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
+def get_job_groups(context: ContextTypes.DEFAULT_TYPE):
+    """(group_id, title) pairs a scheduled job should process: its planned shard, or all groups."""
     groups = database.get_all_active_groups()
+    data = context.job.data if context.job else None
+    if isinstance(data, dict) and 'groups' in data:
+        shard = set(data['groups'])
+        groups = [(group_id, title) for group_id, title in groups if group_id in shard]
+    return groups
+
+def get_job_date(context: ContextTypes.DEFAULT_TYPE):
+    """The local date a scheduled job's groups are on (planned by scheduler.py), or the server's date."""
+    data = context.job.data if context.job else None
+    if isinstance(data, dict) and 'date' in data:
+        return data['date']
+    return date.today()
+
+async def send_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
+    groups = get_job_groups(context)
     msg = random.choice(messages.MOTIVATIONAL_QUOTES)
     
     for group_id, title in groups:
@@ -116,57 +175,311 @@ async def send_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
             logging.error(f"Failed to send reminder to {title} ({group_id}): {e}")
 
 async def report_2pm(context: ContextTypes.DEFAULT_TYPE):
-    groups = database.get_all_active_groups()
+    groups = get_job_groups(context)
+    today = get_job_date(context)
     
     for group_id, title in groups:
         try:
-            count = database.get_submitted_today_count(group_id)
+            count = database.get_submitted_count_by_date(group_id, today.isoformat())
             msg = f"📊 *2 PM Status Update*\n\n{count} members have submitted their report today.\nPlease submit ASAP if you haven't yet."
             await context.bot.send_message(chat_id=group_id, text=msg, parse_mode='Markdown')
         except Exception as e:
             logging.error(f"Failed to send 2pm report to {title} ({group_id}): {e}")
 
+async def prerender_job(context: ContextTypes.DEFAULT_TYPE):
+    """Renders a scheduled report ahead of its send time (job data = {'report': name, 'groups': [ids], 'date': date})."""
+    report = context.job.data['report']
+    try:
+        await prerender.render_all(report, get_job_date(context), context.job.data['groups'])
+    except Exception as e:
+        logging.error(f"Failed to pre-render {report} report: {e}")
+
 async def report_6pm(context: ContextTypes.DEFAULT_TYPE):
-    groups = database.get_all_active_groups()
+    groups = get_job_groups(context)
+    run = prerender.ReportRun('6pm', [group_id for group_id, _ in groups], get_job_date(context))
     
     for group_id, title in groups:
+        state = None
         try:
-            # 1. Stats
-            count = database.get_submitted_today_count(group_id)
-            
-            # 2. Daily Summary (Max/Min)
-            summary_msg = reports.get_daily_stats(group_id)
+            # 1. Stats, Daily Summary and Missing Report (pre-rendered, refreshed with late submissions)
+            state = await run.take(group_id)
             
-            full_msg = f"🌇 *Daily Final Report*\n\nTotal Submissions: {count}\n\n{summary_msg}"
+            started = pytime.perf_counter()
+            full_msg = f"🌇 *Daily Final Report*\n\nTotal Submissions: {state['count']}\n\n{state['summary']}"
             
             await context.bot.send_message(chat_id=group_id, text=full_msg, parse_mode='Markdown')
             
-            # 3. Missing Report Excel
-            file_path = reports.generate_missing_workers_excel(group_id)
+            # 2. Missing Report Excel
+            file_path = state['excel']
             if file_path:
                 await context.bot.send_document(
                     chat_id=group_id, 
                     document=open(file_path, 'rb'),
                     caption="📄 List of members who did not submit today."
                 )
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
+            run.record('send', pytime.perf_counter() - started)
         except Exception as e:
             logging.error(f"Failed to send 6pm report to {title} ({group_id}): {e}")
+        finally:
+            # Taken states are no longer tracked by the run, so clean up even if sending failed
+            if state and state['excel']:
+                try: os.remove(state['excel'])
+                except OSError: pass
+
+    run.finish()
 
 async def report_weekly(context: ContextTypes.DEFAULT_TYPE):
-    """Sends the weekly attendance report (Mon-Sun) to ALL groups"""
-    groups = database.get_all_active_groups()
+    """Sends the weekly attendance report (Mon-Sun) to ALL groups (or the job's shard)"""
+    groups = get_job_groups(context)
+    run = prerender.ReportRun('weekly', [group_id for group_id, _ in groups], get_job_date(context))
     
     for group_id, title in groups:
         try:
-            report_msg = reports.generate_weekly_report(group_id)
-            await context.bot.send_message(chat_id=group_id, text=report_msg, parse_mode='Markdown')
+            state = await run.take(group_id)
+            started = pytime.perf_counter()
+            await context.bot.send_message(chat_id=group_id, text=state['msg'], parse_mode='Markdown')
+            run.record('send', pytime.perf_counter() - started)
         except Exception as e:
              logging.error(f"Failed to send weekly report to {title} ({group_id}): {e}")
 
+    run.finish()
+
+async def recompute_streaks_job(context: ContextTypes.DEFAULT_TYPE):
+    """Nightly job, just after the groups' local midnight: expire stale streaks from submission history."""
+    group_ids = [group_id for group_id, _ in get_job_groups(context)]
+    if not group_ids:
+        return
+    today = get_job_date(context)
+    try:
+        await asyncio.to_thread(streaks.recompute_streaks, group_ids, {group_id: today for group_id in group_ids})
+        # Other webhook workers cache their own groups' streaks
+        sharding.broadcast_reload(group_ids)
+    except Exception as e:
+        logging.error(f"Failed to recompute streaks: {e}")
+
+async def recompute_streaks_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/recompute_streaks [all] - Rebuild streaks from submission history (admin only)."""
+    all_groups = bool(context.args) and context.args[0].lower() == 'all'
+    if not all_groups and update.effective_chat.type not in ['group', 'supergroup']:
+        await update.message.reply_text("Use this command in a group, or `/recompute_streaks all`.", parse_mode='Markdown')
+        return
+
+    if not await is_admin(update, context, bot_wide=all_groups):
+        await update.message.reply_text("Only admins can use this command.")
+        return
+
+    group_ids = None if all_groups else [update.effective_chat.id]
+    updated = await asyncio.to_thread(streaks.recompute_streaks, group_ids)
+    if all_groups:
+        # Other webhook workers cache their own groups' streaks
+        sharding.broadcast_reload()
+    await update.message.reply_text(f"✅ Streaks recomputed. {updated} members updated.")
+
+async def top_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/top [n] - Highest streaks in this group (default 10)."""
+    if update.effective_chat.type not in ['group', 'supergroup']:
+        await update.message.reply_text("This command only works in groups.")
+        return
+
+    await register_group_middleware(update, context)
+    group_id = update.effective_chat.id
+
+    n = 10
+    if context.args:
+        try:
+            n = max(1, min(int(context.args[0]), 50))
+        except ValueError:
+            await update.message.reply_text("Usage: /top [n]\nExample: /top 10")
+            return
+
+    top_streaks = directory.top(group_id, n)
+    if not top_streaks:
+        await update.message.reply_text("No streaks recorded yet.")
+        return
+
+    msg = f"🏆 *Top {len(top_streaks)} Streaks*\n\n"
+    for i, (name, streak) in enumerate(top_streaks, 1):
+        msg += f"{i}. {name} - {streak} days 🔥\n"
+    await update.message.reply_text(msg, parse_mode='Markdown')
+
+async def rank_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/rank - Streak rank of the sender, or of the author of the replied-to message."""
+    if update.effective_chat.type not in ['group', 'supergroup']:
+        await update.message.reply_text("This command only works in groups.")
+        return
+
+    await register_group_middleware(update, context)
+    group_id = update.effective_chat.id
+
+    target = update.message.from_user
+    if update.message.reply_to_message:
+        target = update.message.reply_to_message.from_user
+
+    result = directory.rank(group_id, target.id)
+    if result is None:
+        await update.message.reply_text(f"{target.full_name} has no submissions in this group yet.")
+        return
+
+    rank, total, streak = result
+    await update.message.reply_text(f"📈 {target.full_name}: rank {rank} of {total} (streak: {streak} days)")
+
+async def backup_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await asyncio.to_thread(backup.create_backup)
+    except Exception as e:
+        logging.error(f"Failed to back up database: {e}")
+
+async def backup_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/backup - Take an online database backup now (bot admins only)."""
+    if not await is_admin(update, context, bot_wide=True):
+        await update.message.reply_text("Only admins can use this command.")
+        return
+
+    try:
+        path, size, seconds = await asyncio.to_thread(backup.create_backup)
+    except Exception as e:
+        logging.error(f"Failed to back up database: {e}")
+        await update.message.reply_text("❌ Backup failed. Check the logs.")
+        return
+    await update.message.reply_text(
+        f"✅ Backup saved: {os.path.basename(path)} ({size / 1024:.0f} KB, {seconds:.1f}s)\n"
+        f"{len(database.list_snapshots())} backups kept."
+    )
+
+async def settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /settings - Show this group's timezone and reminder/report times.
+    /settings <timezone|reminder|status|report> <value> - Change one (group admins only).
+    """
+    if update.effective_chat.type not in ['group', 'supergroup']:
+        await update.message.reply_text("This command only works in groups.")
+        return
+
+    await register_group_middleware(update, context)
+    group_id = update.effective_chat.id
+
+    if context.args:
+        names = {'timezone': 'timezone', 'reminder': 'reminder_time', 'status': 'status_time', 'report': 'report_time'}
+        if len(context.args) != 2 or context.args[0].lower() not in names:
+            await update.message.reply_text(
+                "Usage: /settings <timezone|reminder|status|report> <value>\n"
+                "Example: /settings timezone Asia/Kolkata\nExample: /settings report 18:30"
+            )
+            return
+        if not await is_admin(update, context):
+            await update.message.reply_text("Only admins can use this command.")
+            return
+
+        column = names[context.args[0].lower()]
+        value = context.args[1]
+        try:
+            if column == 'timezone':
+                value = pytz.timezone(value).zone
+            else:
+                value = datetime.strptime(value, "%H:%M").strftime("%H:%M")
+        except (pytz.UnknownTimeZoneError, ValueError):
+            await update.message.reply_text("Invalid value. Use a timezone like Asia/Kolkata, or a time like 18:30.")
+            return
+        old = database.get_group_settings(group_id)[group_id][column]
+        await asyncio.to_thread(database.set_group_setting, group_id, column, value)
+        if column == 'timezone' and value != old:
+            # History was converted to the new timezone: streaks follow the new local dates,
+            # and a fresh backup keeps snapshot reads from mixing in old-timezone timestamps
+            await asyncio.to_thread(streaks.recompute_streaks, [group_id])
+            try:
+                await asyncio.to_thread(backup.create_backup)
+            except Exception as e:
+                logging.error(f"Failed to back up after timezone change for {group_id}: {e}")
+
+    s = database.get_group_settings(group_id)[group_id]
+    await update.message.reply_text(
+        # Plain text: zone names like America/New_York contain Markdown underscores
+        f"⚙️ Group Settings\n\n"
+        f"Timezone: {s['timezone']}\n"
+        f"Reminder: {s['reminder_time']}\n"
+        f"Status Update: {s['status_time']}\n"
+        f"Daily Report: {s['report_time']}\n\n"
+        f"Scheduled messages may arrive up to {scheduler.SCHEDULE_JITTER_MINUTES} minutes after these times."
+    )
+
+async def schedule_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/schedule - Planned job shards for the next hours and how long recent shards ran (bot admins only)."""
+    if not await is_admin(update, context, bot_wide=True):
+        await update.message.reply_text("Only admins can use this command.")
+        return
+
+    now = datetime.now(pytz.utc)
+    shards = await asyncio.to_thread(scheduler.plan, now, now + scheduler.PLAN_HORIZON)
+    runs = await asyncio.to_thread(database.get_recent_job_runs, 10)
+
+    msg = "🗓 Planned shards:\n" + (scheduler.format_plan(shards) or "None")
+    msg += "\n\n⏱ Recent runs:\n"
+    if runs:
+        for job, planned_at, started_at, duration, group_count in runs:
+            delay = (datetime.fromisoformat(started_at) - datetime.fromisoformat(planned_at)).total_seconds()
+            msg += f"{planned_at} {job} ({group_count} groups): {duration:.1f}s, started +{delay:.0f}s\n"
+    else:
+        msg += "None"
+    await update.message.reply_text(msg)
+
+async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [seconds] - Sample the running bot and write a flame graph (bot admins only)."""
+    if not await is_admin(update, context, bot_wide=True):
+        await update.message.reply_text("Only admins can use this command.")
+        return
+
+    seconds = 30
+    if context.args:
+        try:
+            seconds = max(1, min(int(context.args[0]), PROFILE_MAX_SECONDS))
+        except ValueError:
+            await update.message.reply_text("Usage: /profile [seconds]\nExample: /profile 30")
+            return
+
+    if profiling.is_profiling():
+        await update.message.reply_text("A profile is already running.")
+        return
+
+    await update.message.reply_text(f"⏳ Profiling for {seconds}s...")
+    result = await asyncio.to_thread(profiling.sample, seconds, PROFILE_DIR)
+    if result is None:
+        await update.message.reply_text("A profile is already running.")
+        return
+
+    collapsed_path, svg_path, samples = result
+    await update.message.reply_text(f"✅ {samples} samples written to:\n{collapsed_path}\n{svg_path}")
+    await context.bot.send_document(
+        chat_id=update.effective_chat.id,
+        document=open(svg_path, 'rb'),
+        caption="🔥 Flame graph"
+    )
+
+async def trace_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/trace [on|off|reset] - Toggle per-call tracing spans and show their totals (bot admins only)."""
+    if not await is_admin(update, context, bot_wide=True):
+        await update.message.reply_text("Only admins can use this command.")
+        return
+
+    arg = context.args[0].lower() if context.args else None
+    if arg in ('on', 'off'):
+        profiling.set_tracing(arg == 'on')
+
+    stats = profiling.span_stats(reset=(arg == 'reset'))
+    msg = f"Tracing is {'on' if profiling.is_tracing() else 'off'}.\n"
+    for name, (count, total, longest) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        msg += f"{name}: {count} calls, avg {total / count * 1000:.1f}ms, max {longest * 1000:.1f}ms\n"
+    await update.message.reply_text(msg)
+
+def start_profile_on_signal():
+    """
+    SIGUSR1 profiles the process for 30s without needing Telegram: `kill -USR1 <pid>`
+    with the pid of the process started by main(). In webhook mode that is the
+    router, which forwards the signal to every worker; each writes its own profile.
+    """
+    def handler(signum, frame):
+        threading.Thread(target=profiling.sample, args=(30, PROFILE_DIR), daemon=True).start()
+    signal.signal(signal.SIGUSR1, handler)
+
 async def manual_report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Only works in groups
     if update.effective_chat.type not in ['group', 'supergroup']:
@@ -176,14 +489,15 @@ async def manual_report_handler(update: Update, context: ContextTypes.DEFAULT_TY
     # Register in case it's new
     await register_group_middleware(update, context)
     group_id = update.effective_chat.id
+    today = database.get_group_now(group_id).date()
 
-    count = database.get_submitted_today_count(group_id)
+    count = database.get_submitted_count_by_date(group_id, today.isoformat())
     summary_msg = reports.get_daily_stats(group_id)
     full_msg = f"📊 *Current Report*\n\nTotal Submissions: {count}\n\n{summary_msg}"
     
     await update.message.reply_text(full_msg, parse_mode='Markdown')
     
-    file_path = reports.generate_missing_workers_excel(group_id)
+    file_path = reports.generate_missing_workers_excel(group_id, today)
     if file_path:
         await context.bot.send_document(
             chat_id=group_id, 
@@ -214,7 +528,7 @@ async def missing_report_handler(update: Update, context: ContextTypes.DEFAULT_T
             await update.message.reply_text("Invalid date format. Use YYYY-MM-DD.\nExample: /missing 2023-10-27")
             return
     else:
-        target_date = datetime.now().date()
+        target_date = database.get_group_now(group_id).date()
         
     date_label = target_date.isoformat()
     
@@ -236,29 +550,39 @@ async def send_saturday_report(context: ContextTypes.DEFAULT_TYPE):
     """
     Sends 'Past 7 Days' stats and 'Low Attendance' Excel on Saturday 8 AM.
     """
-    groups = database.get_all_active_groups()
+    groups = get_job_groups(context)
+    run = prerender.ReportRun('saturday', [group_id for group_id, _ in groups], get_job_date(context))
     
     for group_id, title in groups:
+        state = None
         try:
+            state = await run.take(group_id)
+            started = pytime.perf_counter()
+
             # 1. Past 7 Days Stats
-            stats_msg = reports.get_past_week_stats(group_id)
-            await context.bot.send_message(chat_id=group_id, text=stats_msg, parse_mode='Markdown')
+            await context.bot.send_message(chat_id=group_id, text=state['stats_msg'], parse_mode='Markdown')
             
             # 2. Low Attendance Excel
-            file_path = reports.generate_low_attendance_excel(group_id)
+            file_path = state['excel']
             if file_path:
                 await context.bot.send_document(
                     chat_id=group_id, 
                     document=open(file_path, 'rb'),
                     caption="📄 Low Attendance Alert (< 3 days Mon-Fri)"
                 )
-                try: os.remove(file_path)
-                except: pass
             else:
                 await context.bot.send_message(chat_id=group_id, text="✅ Everyone has good attendance this week (> 3 days)!")
+
+            run.record('send', pytime.perf_counter() - started)
                 
         except Exception as e:
             logging.error(f"Failed to send Saturday report to {title} ({group_id}): {e}")
+        finally:
+            if state and state['excel']:
+                try: os.remove(state['excel'])
+                except OSError: pass
+
+    run.finish()
 
 async def weekly_report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type not in ['group', 'supergroup']:
@@ -268,7 +592,7 @@ async def weekly_report_handler(update: Update, context: ContextTypes.DEFAULT_TY
     await register_group_middleware(update, context)
     group_id = update.effective_chat.id
     
-    stats_msg = reports.get_past_week_stats(group_id)
+    stats_msg = reports.get_past_week_stats(group_id, database.get_group_now(group_id).date())
     await update.message.reply_text(stats_msg, parse_mode='Markdown')
 
 async def fortnightly_report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -279,13 +603,13 @@ async def fortnightly_report_handler(update: Update, context: ContextTypes.DEFAU
     await register_group_middleware(update, context)
     group_id = update.effective_chat.id
     
-    today = datetime.now().date()
+    today = database.get_group_now(group_id).date()
     # "Fortnightly" = Last 15 days
     start_date = today - timedelta(days=14) 
     
     await update.message.reply_text(f"⏳ Generating Fortnightly Report ({start_date} to {today})...")
     
-    file_path = reports.generate_attendance_register(group_id, start_date, today)
+    file_path = reports.generate_attendance_register(group_id, start_date, today, snapshot=REPORTS_FROM_SNAPSHOT)
     
     if file_path:
         await context.bot.send_document(
@@ -306,13 +630,13 @@ async def monthly_report_handler(update: Update, context: ContextTypes.DEFAULT_T
     await register_group_middleware(update, context)
     group_id = update.effective_chat.id
     
-    today = datetime.now().date()
+    today = database.get_group_now(group_id).date()
     # "Monthly" = Last 30 days
     start_date = today - timedelta(days=29) 
     
     await update.message.reply_text(f"⏳ Generating Monthly Report ({start_date} to {today})...")
     
-    file_path = reports.generate_attendance_register(group_id, start_date, today)
+    file_path = reports.generate_attendance_register(group_id, start_date, today, snapshot=REPORTS_FROM_SNAPSHOT)
     
     if file_path:
         await context.bot.send_document(
@@ -325,13 +649,12 @@ async def monthly_report_handler(update: Update, context: ContextTypes.DEFAULT_T
     else:
         await update.message.reply_text("No data found for this period.")
 
-def main():
-    if not TOKEN:
-        print("Error: TELEGRAM_BOT_TOKEN not found in .env file")
-        # return
-
-    database.init_db()
-    
+def build_application(is_leader=True):
+    """
+    Builds the Application with all handlers.
+    Scheduled jobs are only registered on the leader so they run exactly once
+    when several webhook workers are running.
+    """
     application = ApplicationBuilder().token(TOKEN if TOKEN else "DUMMY_TOKEN").build()
     
     # Handlers
@@ -341,6 +664,15 @@ def main():
     application.add_handler(CommandHandler("weekly", weekly_report_handler))
     application.add_handler(CommandHandler("fortnightly", fortnightly_report_handler))
     application.add_handler(CommandHandler("monthly", monthly_report_handler))
+    application.add_handler(CommandHandler("top", top_handler))
+    application.add_handler(CommandHandler("rank", rank_handler))
+    application.add_handler(CommandHandler("recompute_streaks", recompute_streaks_handler))
+    application.add_handler(CommandHandler("backup", backup_handler))
+    application.add_handler(CommandHandler("settings", settings_handler))
+    application.add_handler(CommandHandler("schedule", schedule_handler))
+    # Runs for the whole sampling window, so don't hold up other updates meanwhile
+    application.add_handler(CommandHandler("profile", profile_handler, block=False))
+    application.add_handler(CommandHandler("trace", trace_handler))
     
     # Handles photos
     application.add_handler(MessageHandler(filters.PHOTO, photo_handler))
@@ -353,24 +685,53 @@ def main():
 
     # Job Queue
     job_queue = application.job_queue
-    tz = pytz.timezone('Asia/Kolkata')
-    
-    # 8:00 AM - Reminder
-    job_queue.run_daily(send_daily_reminder, time(hour=8, minute=0, tzinfo=tz))
 
-    # 2:00 PM - Status
-    job_queue.run_daily(report_2pm, time(hour=14, minute=0, tzinfo=tz)) 
-    
-    # 6:00 PM - Daily Final Report
-    job_queue.run_daily(report_6pm, time(hour=18, minute=0, tzinfo=tz))
+    if not is_leader:
+        return application
+    
+    # Per-group streak expiry (12:05 AM), reminder (8 AM), status (2 PM), daily report (6 PM),
+    # Saturday 8 AM and Sunday 8 PM reports, in each group's timezone, staggered in shards (see scheduler.py).
+    # Heavy reports are pre-rendered PRERENDER_LEAD_MINUTES before each shard is sent.
+    scheduler.start(
+        job_queue,
+        {
+            'reminder': send_daily_reminder,
+            '2pm': report_2pm,
+            '6pm': report_6pm,
+            'saturday': send_saturday_report,
+            'weekly': report_weekly,
+            'recompute': recompute_streaks_job,
+        },
+        prerender_callback=prerender_job,
+        prerender_reports=prerender.REPORTS,
+        prerender_lead=timedelta(minutes=prerender.PRERENDER_LEAD_MINUTES),
+    )
 
-    # Sunday 8:00 PM - Weekly Report
-    # days=(6,) means Sunday (Mon=0)
-    job_queue.run_daily(report_weekly, time(hour=20, minute=0, tzinfo=tz), days=(6,))
-    
-    # Saturday 8:00 AM - Stats & Low Attendance Report
-    # days=(5,) means Saturday
-    job_queue.run_daily(send_saturday_report, time(hour=8, minute=0, tzinfo=tz), days=(5,))
+    # Online database backup every BACKUP_INTERVAL_MINUTES
+    job_queue.run_repeating(backup_job, interval=backup.BACKUP_INTERVAL_MINUTES * 60, first=60)
+
+    return application
+
+def main():
+    if not TOKEN:
+        print("Error: TELEGRAM_BOT_TOKEN not found in .env file")
+        # return
+
+    database.init_db()
+    start_profile_on_signal()
+
+    if BOT_MODE == 'webhook':
+        if not TOKEN:
+            # Workers call getMe on startup and would exit (and be restarted) forever
+            print("Webhook mode needs TELEGRAM_BOT_TOKEN; not starting.")
+            return
+        # Each worker process builds its own Application (see sharding.worker_main)
+        print(f"Monitoring Bot is running (Webhook Mode, {sharding.WEBHOOK_WORKERS} workers)...")
+        sharding.run_webhook(build_application)
+        return
+
+    directory.rebuild()
+    application = build_application()
 
     print("Monitoring Bot is running (Multi-Group Mode)...")
     
@@ -0,0 +1,196 @@
+"""
+Pre-rendered scheduled reports.
+
+Heavy report content (stats, Excel files) is rendered for every group shortly
+before the scheduled send time in a background worker pool. At send time each
+group's rendered report is refreshed cheaply with only the submissions that
+arrived after rendering, so the job itself is mostly Telegram sends.
+
+Every report has a render function ((group_id, report date) -> state dict) and
+a refresh function (state -> state). The report date is the group's local date
+the report is for, as planned by the scheduler. States carry a submission-id watermark taken
+before rendering, so nothing that arrives during or after rendering is missed.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import database
+import reports
+
+# How long before the send time to start rendering
+PRERENDER_LEAD_MINUTES = int(os.getenv("PRERENDER_LEAD_MINUTES", "10"))
+PRERENDER_WORKERS = int(os.getenv("PRERENDER_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=PRERENDER_WORKERS, thread_name_prefix="prerender")
+_rendered = {}  # {report_name: {group_id: state}}
+
+def _prerendered_name(path):
+    # Keep pre-rendered files apart from the ones manual commands create and delete
+    return os.path.join(os.path.dirname(path), f"prerendered_{os.path.basename(path)}")
+
+def _move(path):
+    if path is None:
+        return None
+    target = _prerendered_name(path)
+    os.replace(path, target)
+    return target
+
+def _remove(path):
+    if path:
+        try: os.remove(path)
+        except OSError: pass
+
+# --- 6 PM Daily Final Report ---
+
+def render_6pm(group_id, today):
+    watermark = database.get_max_submission_id()
+    missing = reports.get_missing_workers(group_id, today)
+    excel = None
+    if not missing.empty:
+        excel = _prerendered_name(f"missing_report_g{group_id}_{today.isoformat()}.xlsx")
+        missing.to_excel(excel, index=False)
+    return {
+        'group_id': group_id,
+        'date': today,
+        'watermark': watermark,
+        'missing': missing,
+        'excel': excel,
+    }
+
+def refresh_6pm(state):
+    new_ids = database.get_submitters_since(state['group_id'], state['watermark'], state['date'].isoformat())
+    late = state['missing']['Telegram ID'].isin(list(new_ids))
+    if late.any():
+        state['missing'] = state['missing'][~late]
+        if not state['missing'].empty:
+            state['missing'].to_excel(state['excel'], index=False)
+        else:
+            _remove(state['excel'])
+            state['excel'] = None
+    # A single COUNT query, so read at send time rather than patched up from late submitters
+    state['count'] = database.get_submitted_count_by_date(state['group_id'], state['date'].isoformat())
+    # Streak leaderboard is in memory, so the summary is always rendered fresh
+    state['summary'] = reports.get_daily_stats(state['group_id'])
+    return state
+
+# --- Saturday 8 AM Stats & Low Attendance ---
+
+def render_saturday(group_id, today):
+    watermark = database.get_max_submission_id()
+    return {
+        'group_id': group_id,
+        'date': today,
+        'watermark': watermark,
+        'stats_msg': reports.get_past_week_stats(group_id, today),
+        # Covers Mon-Fri, which can no longer change on Saturday
+        'excel': _move(reports.generate_low_attendance_excel(group_id, today)),
+    }
+
+def refresh_saturday(state):
+    # Past 7 days includes today, so re-render the text if anyone submitted since
+    if database.get_submitters_since(state['group_id'], state['watermark'], state['date'].isoformat()):
+        state['stats_msg'] = reports.get_past_week_stats(state['group_id'], state['date'])
+    return state
+
+# --- Sunday 8 PM Weekly Report ---
+
+def render_weekly(group_id, today):
+    watermark = database.get_max_submission_id()
+    return {
+        'group_id': group_id,
+        'date': today,
+        'watermark': watermark,
+        'msg': reports.generate_weekly_report(group_id, today),
+    }
+
+def refresh_weekly(state):
+    if database.get_submitters_since(state['group_id'], state['watermark'], state['date'].isoformat()):
+        state['msg'] = reports.generate_weekly_report(state['group_id'], state['date'])
+    return state
+
+REPORTS = {
+    '6pm': (render_6pm, refresh_6pm),
+    'saturday': (render_saturday, refresh_saturday),
+    'weekly': (render_weekly, refresh_weekly),
+}
+
+def _discard(name, group_ids=None):
+    rendered = _rendered.get(name, {})
+    for group_id in list(rendered if group_ids is None else group_ids):
+        state = rendered.pop(group_id, None)
+        if state is not None:
+            _remove(state.get('excel'))
+
+def _render_timed(render_fn, group_id, report_date):
+    started = time.perf_counter()
+    state = render_fn(group_id, report_date)
+    state['render_seconds'] = time.perf_counter() - started
+    return state
+
+async def render_all(name, report_date, group_ids=None):
+    """Renders a report dated `report_date` for `group_ids` (default every active group) in the worker pool."""
+    render_fn, _ = REPORTS[name]
+    loop = asyncio.get_running_loop()
+
+    if group_ids is None:
+        group_ids = [group_id for group_id, _ in database.get_all_active_groups()]
+
+    # Replace any leftovers from a run that never sent
+    _discard(name, group_ids)
+
+    futures = {group_id: loop.run_in_executor(_executor, _render_timed, render_fn, group_id, report_date) for group_id in group_ids}
+    rendered = _rendered.setdefault(name, {})
+    for group_id, future in futures.items():
+        try:
+            rendered[group_id] = await future
+        except Exception as e:
+            logging.error(f"Failed to pre-render {name} report for {group_id}: {e}")
+
+class ReportRun:
+    """
+    One send of a scheduled report, dated `report_date`, to a set of groups.
+    Collects the time spent per stage (render, refresh, send) and logs it on finish().
+    """
+
+    def __init__(self, name, group_ids, report_date):
+        self.name = name
+        self.group_ids = list(group_ids)
+        self.date = report_date
+        self.stages = {}
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    async def take(self, group_id):
+        """
+        Returns the ready-to-send state for a group: the pre-rendered one refreshed
+        with late submissions, or a fresh render if none is available for the report date.
+        """
+        render_fn, refresh_fn = REPORTS[self.name]
+        state = _rendered.get(self.name, {}).pop(group_id, None)
+        if state is not None and state['date'] != self.date:
+            _remove(state.get('excel'))
+            state = None
+
+        if state is None:
+            state = await asyncio.to_thread(_render_timed, render_fn, group_id, self.date)
+            self.record('render_on_demand', state.pop('render_seconds'))
+        else:
+            # Rendered earlier in the background
+            self.record('render', state.pop('render_seconds'))
+
+        started = time.perf_counter()
+        state = await asyncio.to_thread(refresh_fn, state)
+        self.record('refresh', time.perf_counter() - started)
+        return state
+
+    def finish(self):
+        """Logs the per-stage timings and drops renders that were never sent. Returns the timings."""
+        logging.info(
+            f"Report '{self.name}' ({len(self.group_ids)} groups) stage timings: "
+            + ", ".join(f"{k}={v:.2f}s" for k, v in self.stages.items())
+        )
+        _discard(self.name, self.group_ids)
+        return self.stages
@@ -0,0 +1,180 @@
+"""
+On-demand sampling profiler and opt-in tracing spans for the live bot.
+
+sample() walks the stacks of every thread (the event loop, the asyncio.to_thread
+inference/report threads, the pre-render pool) with sys._current_frames() at a
+fixed interval. It writes the counts as collapsed stacks (one "frame;frame;frame count"
+line per stack, compatible with flamegraph.pl/speedscope) and a self-contained SVG
+flame graph. Nothing is instrumented, so the bot pays no cost when no profile is running.
+
+@traced(name) wraps a sync or async function in a span. Spans are only timed when
+tracing is enabled (TRACE_SPANS=1 or set_tracing(True)). Each call is logged on
+the "trace" logger, and per-span totals are kept for span_stats().
+"""
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from html import escape
+
+PROFILE_INTERVAL = 0.01  # seconds between samples (100 Hz)
+
+_profile_lock = threading.Lock()
+_tracing = os.getenv("TRACE_SPANS", "0") == "1"
+_span_stats = {}  # {name: [count, total_seconds, max_seconds]}
+_span_lock = threading.Lock()
+_trace_log = logging.getLogger("trace")
+
+# --- Sampling profiler ---
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _thread_names():
+    return {t.ident: t.name for t in threading.enumerate()}
+
+def is_profiling():
+    return _profile_lock.locked()
+
+def sample(seconds, out_dir, interval=PROFILE_INTERVAL):
+    """
+    Samples all threads for `seconds` and writes <out_dir>/profile-<timestamp>-<pid>.collapsed
+    and .svg. Blocks the calling thread (run it via asyncio.to_thread or a thread).
+    Returns (collapsed_path, svg_path, sample_count), or None if a profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        own_ident = threading.get_ident()
+        counts = {}  # {"thread;frame;frame": count}
+        samples = 0
+        names = _thread_names()
+        deadline = time.perf_counter() + seconds
+
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = _thread_names()
+                stack.append(names.get(ident, f"thread-{ident}"))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        with open(base + ".collapsed", "w") as f:
+            for key, count in sorted(counts.items()):
+                f.write(f"{key} {count}\n")
+        with open(base + ".svg", "w") as f:
+            f.write(render_flamegraph(counts, title=f"{seconds}s, {samples} samples"))
+
+        logging.info(f"Profile written to {base}.collapsed/.svg ({samples} samples)")
+        return base + ".collapsed", base + ".svg", samples
+    finally:
+        _profile_lock.release()
+
+def render_flamegraph(counts, title="", width=1200, row_height=16):
+    """Renders collapsed stack counts as a standalone SVG flame graph (root at the bottom)."""
+    # Build a tree: node = [count, {child_label: node}]
+    root = [0, {}]
+    for key, count in counts.items():
+        node = root
+        node[0] += count
+        for label in key.split(";"):
+            node = node[1].setdefault(label, [0, {}])
+            node[0] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node[1].values()), default=0)
+
+    rows = depth(root)
+    height = (rows + 1) * row_height + 20
+    total = root[0] or 1
+    rects = []
+
+    def walk(node, x, level):
+        for label, child in sorted(node[1].items()):
+            w = child[0] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * row_height
+                # Warm colors with a stable per-label hue, like the classic flame graphs
+                hue = sum(label.encode()) % 60
+                text = escape(label[:int(w / 7)]) if w > 40 else ""
+                rects.append(
+                    f'<g><title>{escape(label)} ({child[0]} samples, {child[0] / total:.1%})</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},80%,60%)"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row_height - 4}" font-size="11" font-family="monospace">{text}</text></g>'
+                )
+                walk(child, x, level + 1)
+            x += w
+
+    walk(root, 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+        f'<text x="4" y="14" font-size="12" font-family="sans-serif">Flame graph {escape(title)}</text>'
+        + "".join(rects) + "</svg>\n"
+    )
+
+# --- Tracing spans ---
+
+def set_tracing(enabled):
+    global _tracing
+    _tracing = enabled
+
+def is_tracing():
+    return _tracing
+
+def _record_span(name, seconds):
+    with _span_lock:
+        stats = _span_stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    _trace_log.info(f"span {name} {seconds * 1000:.1f}ms")
+
+def span_stats(reset=False):
+    """Returns {name: (count, total_seconds, max_seconds)}."""
+    with _span_lock:
+        stats = {name: tuple(v) for name, v in _span_stats.items()}
+        if reset:
+            _span_stats.clear()
+    return stats
+
+def traced(name):
+    """Decorator: records a span around each call when tracing is enabled."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _tracing:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _record_span(name, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracing:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record_span(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
@@ -1,38 +1,56 @@
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta
 import database
+import directory
 import os
+from profiling import traced
 
-def generate_missing_workers_excel(group_id, date_obj=None):
+def _visit_counts(users, submissions):
+    """Visits per user, aligned with the directory columns, from (user_id, date_str) rows."""
+    if not submissions:
+        return np.zeros(len(users), dtype=np.int64)
+    idx = users.index_of(np.fromiter((sub[0] for sub in submissions), dtype=np.int64, count=len(submissions)))
+    return np.bincount(idx[idx >= 0], minlength=len(users))
+
+@traced('reports.get_missing_workers')
+def get_missing_workers(group_id, date_obj=None):
+    """Returns a DataFrame of members who did not submit on `date_obj` (default today)."""
     if date_obj is None:
         date_obj = date.today()
     
     date_str = date_obj.isoformat()
-    all_users = database.get_all_users(group_id) # list of dicts
+    users = directory.columns(group_id)
     
     # Use generic date function
     submitted_ids = database.get_submitted_users_by_date(group_id, date_str) 
     
-    missing_workers = []
-    for user in all_users:
-        if user['user_id'] not in submitted_ids:
-            missing_workers.append({
-                'Name': user['full_name'],
-                'Telegram ID': user['user_id'],
-                'Date': date_str
-            })
+    missing = ~np.isin(users.user_ids, np.fromiter(submitted_ids, dtype=np.int64, count=len(submitted_ids)))
+    return pd.DataFrame({
+        'Name': users.names[missing],
+        'Telegram ID': users.user_ids[missing],
+        'Date': date_str
+    })
+
+@traced('reports.generate_missing_workers_excel')
+def generate_missing_workers_excel(group_id, date_obj=None):
+    if date_obj is None:
+        date_obj = date.today()
+    
+    date_str = date_obj.isoformat()
+    df = get_missing_workers(group_id, date_obj)
             
-    if not missing_workers:
+    if df.empty:
         return None
         
-    df = pd.DataFrame(missing_workers)
     filename = f"missing_report_g{group_id}_{date_str}.xlsx"
     df.to_excel(filename, index=False)
     return filename
 
+@traced('reports.get_daily_stats')
 def get_daily_stats(group_id):
     """Generates a text summary for the daily report (6 PM)."""
-    top_streaks = database.get_top_performing_users(group_id, 5)
+    top_streaks = directory.top(group_id, 5)
     
     msg = "📊 *Daily Inspection Summary *\n\n"
     if top_streaks:
@@ -44,6 +62,7 @@ def get_daily_stats(group_id):
         
     return msg
 
+@traced('reports.generate_weekly_report')
 def generate_weekly_report(group_id, end_date=None):
     """
     Generates a report for the week ending on `end_date` (default today).
@@ -60,39 +79,28 @@ def generate_weekly_report(group_id, end_date=None):
     # Get all submissions in this range for this GROUP
     submissions = database.get_submissions_between_dates(group_id, start_str, end_str)
     
-    # Count visits per user
-    user_counts = {} # {user_id: count}
-    for sub in submissions:
-        uid = sub[0]
-        user_counts[uid] = user_counts.get(uid, 0) + 1
-        
-    # Get all known users in this GROUP
-    all_users = database.get_all_users(group_id)
-    
-    report_data = []
-    for user in all_users:
-        uid = user['user_id']
-        name = user['full_name']
-        count = user_counts.get(uid, 0)
-        report_data.append({'Name': name, 'Visits': count})
+    # Count visits per known user in this GROUP
+    users = directory.columns(group_id)
+    visits = _visit_counts(users, submissions)
         
     # Sort by visits (descending)
-    report_data.sort(key=lambda x: x['Visits'], reverse=True)
+    order = np.argsort(-visits, kind='stable')
     
     # Generate Text Report
     msg = f"📅 *Weekly Report ({start_str} to {end_str})*\n\n"
     msg += "*Attendance Summary (Days Visited):*\n"
-    for item in report_data:
-        msg += f"- {item['Name']}: {item['Visits']}/7\n"
+    msg += "".join(f"- {name}: {count}/7\n" for name, count in zip(users.names[order], visits[order]))
         
     return msg
 
-def get_past_week_stats(group_id):
+@traced('reports.get_past_week_stats')
+def get_past_week_stats(group_id, today=None):
     """
-    Generates text stats for the past 7 days (including today).
+    Generates text stats for the past 7 days (including `today`, default today).
     Useful for /weekly command which can be run any day.
     """
-    today = date.today()
+    if today is None:
+        today = date.today()
     start_date = today - timedelta(days=6) # 7 days inclusive
     
     start_str = start_date.isoformat()
@@ -100,31 +108,20 @@ def get_past_week_stats(group_id):
     
     submissions = database.get_submissions_between_dates(group_id, start_str, end_str)
     
-    user_counts = {}
-    for sub in submissions:
-        uid = sub[0]
-        user_counts[uid] = user_counts.get(uid, 0) + 1
-        
-    all_users = database.get_all_users(group_id)
-    report_data = []
-    for user in all_users:
-        uid = user['user_id']
-        name = user['full_name']
-        count = user_counts.get(uid, 0)
-        report_data.append({'Name': name, 'Visits': count})
-        
-    report_data.sort(key=lambda x: x['Visits'], reverse=True)
+    users = directory.columns(group_id)
+    visits = _visit_counts(users, submissions)
+    order = np.argsort(-visits, kind='stable')
     
     msg = f"📅 *Past 7 Days Report ({start_str} to {end_str})*\n\n"
-    for item in report_data:
-        msg += f"- {item['Name']}: {item['Visits']} days\n"
+    msg += "".join(f"- {name}: {count} days\n" for name, count in zip(users.names[order], visits[order]))
         
     return msg
 
-def generate_low_attendance_excel(group_id):
+@traced('reports.generate_low_attendance_excel')
+def generate_low_attendance_excel(group_id, today=None):
     """
     Generates Excel list of people with < 3 submissions in the last week (Mon-Sat).
-    To be run on Saturday 8 AM.
+    To be run on Saturday 8 AM (`today`, default today).
     """
     # Logic: Last Mon to Last Sat (which is yesterday relative to Sunday, or today relative to Sat).
     # Assuming this runs on Saturday morning, we look at Mon (5 days ago) to Sat (today) - wait, if run at 8AM Sat, Sat is just starting.
@@ -135,7 +132,8 @@ def generate_low_attendance_excel(group_id):
     # Best approach: If run on Saturday AM, check Monday to Friday (5 days). If user attended < 3 times.
     # Alternatively, if meant for "end of week", maybe check Monday to Friday.
     
-    today = date.today() # Saturday
+    if today is None:
+        today = date.today() # Saturday
     # Monday of this week
     monday = today - timedelta(days=today.weekday()) 
     # Check Mon -> Fri (5 days)
@@ -153,106 +151,71 @@ def generate_low_attendance_excel(group_id):
     end_str = friday.isoformat()
     
     submissions = database.get_submissions_between_dates(group_id, start_str, end_str)
-    user_counts = {}
-    for sub in submissions:
-        uid = sub[0]
-        user_counts[uid] = user_counts.get(uid, 0) + 1
-        
-    all_users = database.get_all_users(group_id)
-    low_attendance = []
-    
-    for user in all_users:
-        uid = user['user_id']
-        count = user_counts.get(uid, 0)
-        if count < 3:
-            low_attendance.append({
-                'Name': user['full_name'],
-                'Telegram ID': user['user_id'],
-                'Visits (Mon-Fri)': count
-            })
+    users = directory.columns(group_id)
+    visits = _visit_counts(users, submissions)
+    low = visits < 3
             
-    if not low_attendance:
+    if not low.any():
         return None
         
-    df = pd.DataFrame(low_attendance)
+    df = pd.DataFrame({
+        'Name': users.names[low],
+        'Telegram ID': users.user_ids[low],
+        'Visits (Mon-Fri)': visits[low]
+    })
     filename = f"low_attendance_g{group_id}_{start_str}_to_{end_str}.xlsx"
     df.to_excel(filename, index=False)
     return filename
 
-def generate_attendance_register(group_id, start_date, end_date):
+@traced('reports.generate_attendance_register')
+def generate_attendance_register(group_id, start_date, end_date, snapshot=False):
     """
     Generates a Matrix Report (Attendance Register).
     Rows: Users
     Columns: Dates from start_date to end_date
     Values: 'P' (Present) or '' (Absent)
     Sorted by Attendance Percentage (Ascending) to show least active first.
+    With snapshot=True, submissions for days the latest backup (if recent) fully covers are read from it,
+    and later days from the live database.
     """
     start_str = start_date.isoformat()
     end_str = end_date.isoformat()
     
     # 1. Get all submissions
-    submissions = database.get_submissions_between_dates(group_id, start_str, end_str) # List of (user_id, date_str)
+    submissions = database.get_submissions_between_dates(group_id, start_str, end_str, snapshot) # List of (user_id, date_str)
     
     # 2. Get all users
-    all_users = database.get_all_users(group_id) # List of dicts
+    users = directory.columns(group_id)
+    if len(users) == 0:
+        return None
     
     # 3. Create Date Range
     delta = end_date - start_date
     date_list = [start_date + timedelta(days=i) for i in range(delta.days + 1)]
     date_columns = [d.isoformat() for d in date_list]
-    
-    # 4. Build Matrix Data
-    # Structure: {'User ID': ..., 'Name': ..., 'Date1': 'P', 'Date2': '' ...}
-    
-    # Map submissions for quick lookup: {(user_id, date_str): True}
-    submission_map = set()
-    for sub in submissions:
-        # sub is (user_id, date_str)
-        submission_map.add((sub[0], sub[1]))
-        
-    matrix_data = []
-    
-    for user in all_users:
-        uid = user['user_id']
-        name = user['full_name']
-        
-        row = {
-            'Name': name,
-            # 'Telegram ID': uid 
-        }
-        
-        present_count = 0
-        total_days = len(date_columns)
-        
-        for d_str in date_columns:
-            if (uid, d_str) in submission_map:
-                row[d_str] = 'P'
-                present_count += 1
-            else:
-                row[d_str] = '' # Empty for absent
-                
-        attendance_pct = (present_count / total_days) * 100 if total_days > 0 else 0
-        
-        row['Total Present'] = present_count
-        row['Total Days'] = total_days
-        row['Percentage'] = round(attendance_pct, 1)
-        
-        matrix_data.append(row)
-        
-    # 5. Create DataFrame
-    if not matrix_data:
-        return None
-        
-    df = pd.DataFrame(matrix_data)
+    total_days = len(date_columns)
+    
+    # 4. Build Matrix: present[user_index, day_index]
+    present = np.zeros((len(users), total_days), dtype=bool)
+    if submissions:
+        rows = users.index_of(np.fromiter((sub[0] for sub in submissions), dtype=np.int64, count=len(submissions)))
+        days = np.array([sub[1] for sub in submissions], dtype='datetime64[D]')
+        cols = (days - np.datetime64(start_str)).astype(np.int64)
+        valid = (rows >= 0) & (cols >= 0) & (cols < total_days)
+        present[rows[valid], cols[valid]] = True
+        
+    present_count = present.sum(axis=1)
+    attendance_pct = present_count / total_days * 100 if total_days > 0 else np.zeros(len(users))
+    
+    # 5. Create DataFrame: Name, Percentage, Total Present, then Dates ('P' or '' for absent)
+    df = pd.DataFrame(np.where(present, 'P', ''), columns=date_columns)
+    df.insert(0, 'Name', users.names)
+    df.insert(1, 'Percentage', np.round(attendance_pct, 1))
+    df.insert(2, 'Total Present', present_count)
     
     # 6. Sort by Percentage (low to high)
     df.sort_values(by='Percentage', ascending=True, inplace=True)
     
-    # 7. Reorder columns to put Stats first or last? 
-    # Let's keep Name, Percentage, Total Present, then Dates...
-    cols = ['Name', 'Percentage', 'Total Present'] + date_columns
-    df = df[cols]
-    
     filename = f"attendance_register_g{group_id}_{start_str}_to_{end_str}.xlsx"
     df.to_excel(filename, index=False)
     
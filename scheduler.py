@@ -0,0 +1,181 @@
+"""
+Per-group, timezone-aware scheduling of the daily jobs.
+
+Each group has its own timezone and reminder/status/report times (see
+database.GROUP_SETTINGS). Instead of one job that processes every group at the
+same second, the planner splits all groups that share a job's send time into
+shards of about SCHEDULE_SHARD_SIZE and spreads the shards evenly across a
+SCHEDULE_JITTER_MINUTES window after that time. A group's shard is a stable
+hash of it modulo the shard count, so groups keep their shard (and send
+offset) when others are added or removed, until the shard count changes.
+
+The planner runs every PLAN_INTERVAL_MINUTES and schedules the shards that
+fall inside the next planning window with job_queue.run_once. Settings
+changes take effect from the next window onward. Each job callback receives
+its shard's group ids in context.job.data['groups'], and the groups' local
+date of the run in context.job.data['date'].
+"""
+import hashlib
+import logging
+import os
+import time as pytime
+from datetime import datetime, time, timedelta
+import pytz
+import database
+
+SCHEDULE_JITTER_MINUTES = int(os.getenv("SCHEDULE_JITTER_MINUTES", "10"))
+SCHEDULE_SHARD_SIZE = int(os.getenv("SCHEDULE_SHARD_SIZE", "25"))
+PLAN_INTERVAL_MINUTES = 60
+# Plan a bit further than the interval so every shard is planned well before it runs
+PLAN_HORIZON = timedelta(minutes=PLAN_INTERVAL_MINUTES * 2)
+
+# job name -> (group setting holding the local time, or a fixed "HH:MM"; local weekdays or None for daily)
+JOBS = {
+    'reminder': ('reminder_time', None),
+    '2pm': ('status_time', None),
+    '6pm': ('report_time', None),
+    'saturday': ('08:00', (5,)),
+    'weekly': ('20:00', (6,)),
+    # Just after local midnight, so streaks are expired before the day's reports
+    'recompute': ('00:05', None),
+}
+
+_planned_until = None
+
+def _parse_time(value):
+    hour, minute = value.split(':')
+    return time(hour=int(hour), minute=int(minute))
+
+def _stable_hash(job, group_id):
+    return int.from_bytes(hashlib.md5(f"{job}:{group_id}".encode()).digest()[:8], 'big')
+
+def plan(start, end, settings=None):
+    """
+    Returns the shards due in [start, end) (aware datetimes), sorted by time:
+    [{'job': name, 'when': aware UTC datetime, 'base': aware UTC datetime, 'date': local date,
+      'shard': k, 'shards': n, 'groups': [ids]}]
+    """
+    if settings is None:
+        settings = database.get_group_settings()
+
+    jitter = timedelta(minutes=SCHEDULE_JITTER_MINUTES)
+    # {(job, base_utc, local date): [group_id]}
+    buckets = {}
+    for group_id, s in settings.items():
+        try:
+            tz = pytz.timezone(s['timezone'])
+        except pytz.UnknownTimeZoneError:
+            logging.error(f"Unknown timezone {s['timezone']!r} for group {group_id}, using default")
+            tz = pytz.timezone(database.GROUP_SETTINGS['timezone'])
+
+        # Check the local dates that can overlap the window, widened by the jitter
+        first_day = (start - jitter).astimezone(tz).date() - timedelta(days=1)
+        last_day = end.astimezone(tz).date()
+        for job, (time_source, days) in JOBS.items():
+            local_time = _parse_time(s.get(time_source, time_source))
+            day = first_day
+            while day <= last_day:
+                if days is None or day.weekday() in days:
+                    base = tz.localize(datetime.combine(day, local_time)).astimezone(pytz.utc)
+                    buckets.setdefault((job, base, day), []).append(group_id)
+                day += timedelta(days=1)
+
+    shards = []
+    for (job, base, day), group_ids in buckets.items():
+        n = (len(group_ids) + SCHEDULE_SHARD_SIZE - 1) // SCHEDULE_SHARD_SIZE
+        members = [[] for _ in range(n)]
+        for group_id in sorted(group_ids):
+            members[_stable_hash(job, group_id) % n].append(group_id)
+        for k in range(n):
+            when = base + jitter * k / n
+            if members[k] and start <= when < end:
+                shards.append({
+                    'job': job,
+                    'when': when,
+                    'base': base,
+                    'date': day,
+                    'shard': k,
+                    'shards': n,
+                    'groups': members[k],
+                })
+    shards.sort(key=lambda s: (s['when'], s['job']))
+    return shards
+
+def _local_tz():
+    """The server's local timezone, in which database timestamps are written."""
+    return datetime.now().astimezone().tzinfo
+
+def _timed(job, callback):
+    """Wraps a job callback to record how long each shard ran."""
+    async def run(context):
+        data = context.job.data
+        started_at = datetime.now()
+        started = pytime.perf_counter()
+        try:
+            await callback(context)
+        finally:
+            duration = pytime.perf_counter() - started
+            planned_at = data['when'].astimezone(_local_tz()).replace(tzinfo=None)
+            logging.info(
+                f"Job {job} shard {data['shard'] + 1}/{data['shards']} "
+                f"({len(data['groups'])} groups) ran {duration:.2f}s, "
+                f"started {(started_at - planned_at).total_seconds():.1f}s after plan"
+            )
+            try:
+                database.log_job_run(job, planned_at.isoformat(timespec='seconds'), started_at.isoformat(),
+                                     duration, len(data['groups']))
+            except Exception as e:
+                logging.error(f"Failed to record run of {job}: {e}")
+    return run
+
+def start(job_queue, callbacks, prerender_callback=None, prerender_reports=(), prerender_lead=timedelta(0)):
+    """
+    Starts the planner.
+    callbacks: {job name: async callback}, run per shard.
+    prerender_callback is run prerender_lead before each shard of a job in prerender_reports,
+    with data {'report': job name, 'groups': [ids], 'date': local date}.
+    """
+    timed = {job: _timed(job, cb) for job, cb in callbacks.items()}
+
+    async def plan_job(context):
+        global _planned_until
+        now = datetime.now(pytz.utc)
+        start = max(now, _planned_until) if _planned_until else now
+        end = now + PLAN_HORIZON
+        if start >= end:
+            return
+
+        try:
+            shards = plan(start, end)
+        except Exception as e:
+            logging.error(f"Failed to plan scheduled jobs: {e}")
+            return
+
+        for shard in shards:
+            job = shard['job']
+            if job not in timed:
+                continue
+            name = f"{job}:{shard['when'].isoformat()}"
+            context.job_queue.run_once(timed[job], when=shard['when'], data=shard, name=name)
+            prerender_at = shard['when'] - prerender_lead
+            # If the render slot already passed, the report renders on demand at send time
+            if prerender_callback and job in prerender_reports and prerender_at > now:
+                context.job_queue.run_once(prerender_callback, when=prerender_at,
+                                           data={'report': job, 'groups': shard['groups'], 'date': shard['date']},
+                                           name=f"prerender-{name}")
+        _planned_until = end
+        logging.info(f"Planned {len(shards)} job shards until {end.isoformat(timespec='minutes')}")
+
+    job_queue.run_repeating(plan_job, interval=PLAN_INTERVAL_MINUTES * 60, first=1)
+
+def format_plan(shards, limit=15):
+    """Human-readable summary of planned shards."""
+    lines = []
+    for shard in shards[:limit]:
+        lines.append(
+            f"{shard['when'].astimezone(_local_tz()).strftime('%a %H:%M:%S')} "
+            f"{shard['job']} shard {shard['shard'] + 1}/{shard['shards']} ({len(shard['groups'])} groups)"
+        )
+    if len(shards) > limit:
+        lines.append(f"... and {len(shards) - limit} more")
+    return "\n".join(lines)
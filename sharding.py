@@ -0,0 +1,261 @@
+"""
+Webhook serving mode with sharded worker processes.
+
+A small HTTP server (the router) receives Telegram webhook POSTs and forwards each
+update to one of N worker processes, chosen by consistent hashing of chat_id.
+All updates for a group therefore land on the same worker, in the order they
+arrived, and that worker owns the group's in-memory state (its user directory and streak leaderboard).
+Worker 0 is the leader and is the only one that runs the scheduled jobs.
+Workers can ask each other to reload their cached state (broadcast_reload), e.g.
+after a recompute that wrote streaks for groups other workers own. The router
+checks its workers every WORKER_CHECK_SECONDS and restarts any that died, so the
+leader's scheduled jobs keep running. Updates routed to a dead worker get a 503
+so Telegram retries them once the worker is back.
+SIGUSR1 sent to the router is forwarded to every worker (see main.start_profile_on_signal).
+
+Webhook mode needs a real TELEGRAM_BOT_TOKEN and network access to the Bot API,
+because every worker's Application calls getMe when it starts (main() refuses to
+start without a token). To test locally without registering a webhook, leave
+WEBHOOK_URL unset, start with BOT_MODE=webhook and replay recorded updates (one
+JSON update per line); replies are sent to the chats in the recorded updates:
+    python sharding.py replay updates.jsonl http://localhost:8443/telegram
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import urllib.request
+from bisect import bisect
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import directory
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+# Public base URL registered with Telegram (e.g. https://bot.example.com). Leave unset for local testing.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WORKER_CHECK_SECONDS = 5
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent hash ring mapping chat_ids to worker indexes."""
+
+    def __init__(self, workers, replicas=64):
+        points = sorted((_hash(f"worker-{w}#{r}"), w) for w in range(workers) for r in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._workers = [w for _, w in points]
+
+    def worker_for(self, chat_id):
+        i = bisect(self._hashes, _hash(str(chat_id))) % len(self._hashes)
+        return self._workers[i]
+
+def extract_chat_id(data):
+    """Returns the chat_id an update belongs to, or None (e.g. inline queries)."""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                'my_chat_member', 'chat_member', 'chat_join_request'):
+        if key in data:
+            return data[key].get('chat', {}).get('id')
+    if 'callback_query' in data:
+        message = data['callback_query'].get('message')
+        if message:
+            return message.get('chat', {}).get('id')
+        return data['callback_query'].get('from', {}).get('id')
+    return None
+
+# Control messages are put on worker queues alongside updates (Telegram updates never have this key):
+# {'control': 'reload', 'groups': [ids] or None for all}
+
+# Set in worker processes only
+_worker_index = None
+_worker_queues = None
+
+def broadcast_reload(group_ids=None):
+    """Tells every other worker to reload its user directories (or just `group_ids`). No-op outside webhook mode."""
+    if _worker_queues is None:
+        return
+    for i, q in enumerate(_worker_queues):
+        if i != _worker_index:
+            q.put({'control': 'reload', 'groups': group_ids})
+
+def _reload(group_ids):
+    if group_ids is None:
+        directory.rebuild()
+    else:
+        for group_id in group_ids:
+            directory.rebuild(group_id)
+
+def worker_main(index, workers, queues, build_application, sigusr1_handler):
+    """Entry point of a worker process: feeds routed updates into its own Application."""
+    from telegram import Update
+
+    # Restore the handler main() installed; the router replaces its own with a forwarder
+    signal.signal(signal.SIGUSR1, sigusr1_handler)
+
+    global _worker_index, _worker_queues
+    _worker_index = index
+    _worker_queues = queues
+    queue = queues[index]
+
+    ring = HashRing(workers)
+    directory.set_owner(lambda group_id: ring.worker_for(group_id) == index)
+    directory.rebuild()
+
+    is_leader = index == 0
+    application = build_application(is_leader=is_leader)
+
+    async def run():
+        async with application:
+            await application.start()
+            if is_leader and WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            logging.info(f"Worker {index} ready{' (leader)' if is_leader else ''}")
+            while True:
+                data = await asyncio.to_thread(queue.get)
+                if data is None:
+                    break
+                if data.get('control') == 'reload':
+                    try:
+                        await asyncio.to_thread(_reload, data['groups'])
+                    except Exception as e:
+                        logging.error(f"Worker {index} failed to reload caches: {e}")
+                    continue
+                try:
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+                except Exception as e:
+                    logging.error(f"Worker {index} failed to decode update {data.get('update_id')}: {e}")
+            await application.stop()
+
+    asyncio.run(run())
+
+class _RouterHandler(BaseHTTPRequestHandler):
+    ring = None
+    queues = None
+    revive = None
+
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if WEBHOOK_SECRET and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length))
+        except (ValueError, json.JSONDecodeError):
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        chat_id = extract_chat_id(data)
+        # Updates without a chat have no per-group state; send them to the leader
+        worker = 0 if chat_id is None else self.ring.worker_for(chat_id)
+        if self.revive(worker):
+            # Not queued: Telegram redelivers the update after an error response
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.queues[worker].put(data)
+
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Silence per-request access logs (like httpx in polling mode)
+        pass
+
+def run_webhook(build_application, workers=WEBHOOK_WORKERS):
+    """
+    Starts the worker processes and serves the router until interrupted.
+    The router is single-threaded so updates are queued in the order received.
+    """
+    # fork so workers share the already-loaded model instead of loading it again
+    ctx = multiprocessing.get_context('fork')
+    queues = [ctx.Queue() for _ in range(workers)]
+    sigusr1_handler = signal.getsignal(signal.SIGUSR1)
+
+    def spawn(i):
+        p = ctx.Process(target=worker_main, args=(i, workers, queues, build_application, sigusr1_handler), daemon=True)
+        p.start()
+        return p
+
+    processes = [spawn(i) for i in range(workers)]
+    processes_lock = threading.Lock()
+
+    def revive(i):
+        """Restarts worker i if it died. Returns True if it had to be restarted."""
+        with processes_lock:
+            process = processes[i]
+            if process.is_alive():
+                return False
+            logging.error(f"Worker {i} died (exit code {process.exitcode}), restarting it")
+            processes[i] = spawn(i)
+            return True
+
+    stopping = threading.Event()
+
+    def supervise():
+        while not stopping.wait(WORKER_CHECK_SECONDS):
+            for i in range(workers):
+                revive(i)
+
+    threading.Thread(target=supervise, name="worker-supervisor", daemon=True).start()
+
+    def forward_sigusr1(signum, frame):
+        for p in processes:
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGUSR1)
+    signal.signal(signal.SIGUSR1, forward_sigusr1)
+
+    _RouterHandler.ring = HashRing(workers)
+    _RouterHandler.queues = queues
+    _RouterHandler.revive = staticmethod(revive)
+    server = HTTPServer((WEBHOOK_LISTEN, WEBHOOK_PORT), _RouterHandler)
+    logging.info(f"Webhook router listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopping.set()
+        server.server_close()
+        for q in queues:
+            q.put(None)
+        for p in processes:
+            p.join(timeout=30)
+
+def replay(path, url):
+    """POSTs recorded updates (one JSON object per line) to a running router."""
+    headers = {'Content-Type': 'application/json'}
+    if WEBHOOK_SECRET:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = WEBHOOK_SECRET
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            req = urllib.request.Request(url, data=line.encode(), headers=headers, method='POST')
+            with urllib.request.urlopen(req) as resp:
+                print(f"{json.loads(line).get('update_id')}: {resp.status}")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'replay':
+        print("Usage: python sharding.py replay <updates.jsonl> <url>")
+        sys.exit(1)
+    replay(sys.argv[2], sys.argv[3])
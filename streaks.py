@@ -0,0 +1,111 @@
+import logging
+import time
+from datetime import date
+import numpy as np
+import database
+import directory
+
+def compute_streaks(group_ids, user_ids, days, today=None):
+    """
+    Computes the current streak for every (group_id, user_id) in one vectorized pass.
+
+    Inputs are parallel arrays of distinct submission days (days as date.toordinal()).
+    A streak continues when the next submission is the following day, or when a
+    Saturday submission is followed by a Monday one (Sunday is optional), the same
+    rule log_submission applies. A streak that can no longer be continued today is 0.
+    `today` is a date, or {group_id: date} for groups in different timezones
+    (groups missing from it use the server's date).
+
+    Returns (group_ids, user_ids, streaks, last_days), one entry per user.
+    """
+    if today is None:
+        today = date.today()
+
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    n = len(days)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+
+    # Sort by group, then user, then day
+    order = np.lexsort((days, user_ids, group_ids))
+    group_ids = group_ids[order]
+    user_ids = user_ids[order]
+    days = days[order]
+
+    same_key = np.zeros(n, dtype=bool)
+    same_key[1:] = (group_ids[1:] == group_ids[:-1]) & (user_ids[1:] == user_ids[:-1])
+
+    gap = np.zeros(n, dtype=np.int64)
+    gap[1:] = days[1:] - days[:-1]
+    # date.fromordinal(1) is a Monday, so weekday() == (ordinal - 1) % 7
+    is_monday = (days - 1) % 7 == 0
+    continues = same_key & ((gap == 1) | ((gap == 2) & is_monday))
+
+    # Streak at each row = distance from the start of its run + 1
+    idx = np.arange(n, dtype=np.int64)
+    run_start = np.maximum.accumulate(np.where(continues, 0, idx))
+    streak_at = idx - run_start + 1
+
+    is_last = np.ones(n, dtype=bool)
+    is_last[:-1] = ~same_key[1:]
+
+    last_groups = group_ids[is_last]
+    last_days = days[is_last]
+    streaks = streak_at[is_last]
+
+    if isinstance(today, dict):
+        uniq, inverse = np.unique(last_groups, return_inverse=True)
+        default = date.today()
+        today_ord = np.array([today.get(g, default).toordinal() for g in uniq.tolist()], dtype=np.int64)[inverse]
+    else:
+        today_ord = today.toordinal()
+
+    # Still alive if submitted today/yesterday, or on Saturday when today is Monday
+    since = today_ord - last_days
+    alive = (since <= 1) | ((since == 2) & ((today_ord - 1) % 7 == 0))
+    streaks = np.where(alive, streaks, 0)
+
+    return last_groups, user_ids[is_last], streaks, last_days
+
+def recompute_streaks(group_ids=None, today=None):
+    """
+    Recomputes streaks from submission history for a list of groups (or all groups if None)
+    and writes back only the rows that changed. Users who submit while this runs keep
+    the streak log_submission gave them. Returns the number of updated users.
+    """
+    started = time.perf_counter()
+    if today is None:
+        # Each group's own date, in the timezone its submissions are recorded in
+        today = {gid: database.local_now(s['timezone']).date()
+                 for gid, s in database.get_group_settings().items()}
+    # Taken before reading history so that submissions logged meanwhile are detected
+    watermark = database.get_max_submission_id()
+    rows = database.get_submission_days(group_ids)
+    if rows:
+        g, u, d = zip(*rows)
+    else:
+        g, u, d = (), (), ()
+
+    groups, users, new_streaks, _ = compute_streaks(g, u, d, today)
+    computed = dict(zip(zip(groups.tolist(), users.tolist()), new_streaks.tolist()))
+
+    updates = []
+    for (gid, uid), old_streak in database.get_streaks(group_ids).items():
+        # Users without any submission history have no streak
+        new_streak = computed.get((gid, uid), 0)
+        if new_streak != old_streak:
+            updates.append((new_streak, uid, gid))
+
+    if updates:
+        updates = database.set_streaks(updates, watermark)
+        directory.update_streaks(updates, watermark)
+
+    logging.info(
+        f"Recomputed streaks for {'all groups' if group_ids is None else f'{len(group_ids)} groups'}: "
+        f"{len(rows)} submission days, {len(updates)} users updated "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return len(updates)